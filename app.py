@@ -1,15 +1,48 @@
 # app.py — single-page, retry-hardened, overwrite-safe, compact UI
-import io, json, time, hashlib, ssl, re
-from typing import Dict, Any, Optional, List, Tuple
+import io, json, gzip, time, ssl, re, threading, uuid, functools
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait as wait_futures
+from datetime import datetime
+from typing import Dict, Any, Optional, List, Tuple, Union
 import requests
+from requests.adapters import HTTPAdapter
 from PIL import Image
 import streamlit as st
 
+try:  # C-speed JSON; stdlib json accepts the same bytes input as a fallback
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    orjson = None
+    _json_loads = json.loads
+
+def _json_bytes(obj: Any) -> bytes:
+    """Compact UTF-8 JSON (orjson never escapes non-ASCII, matching ensure_ascii=False)."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def _jsonl_line(obj: Dict[str, Any]) -> bytes:
+    return _json_bytes(obj) + b"\n"
+
+try:  # optional: libvips does SIMD JPEG decode/encode with shrink-on-load
+    import pyvips
+except Exception:  # ImportError, or OSError when the libvips shared library is missing
+    pyvips = None
+
+try:  # optional: on-disk blob tier so image bytes survive process restarts
+    import diskcache
+except ImportError:
+    diskcache = None
+
 # Google Drive API
+import httplib2
+import google_auth_httplib2
+from google.auth.transport.requests import Request as GoogleAuthRequest
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from googleapiclient.http import MediaIoBaseDownload, MediaIoBaseUpload
+from googleapiclient.http import MediaIoBaseUpload
 
 # ---------- Safe image defaults ----------
 Image.MAX_IMAGE_PIXELS = 80_000_000
@@ -62,86 +95,398 @@ if "user" not in st.session_state:
     st.stop()
 
 # =========================== Drive helpers ===========================
+_GCP: Dict[str, Any] = dict(st.secrets.get("gcp", {}))  # one snapshot per run, plain dict lookups after
+
 @st.cache_resource
-def get_drive():
-    sa_raw = st.secrets["gcp"]["service_account"]
+def get_credentials():
+    sa_raw = _GCP["service_account"]
     if isinstance(sa_raw, str):
         if '"private_key"' in sa_raw and "\n" in sa_raw and "\\n" not in sa_raw:
             sa_raw = sa_raw.replace("\r\n", "\\n").replace("\n", "\\n")
         sa = json.loads(sa_raw)
     else:
         sa = dict(sa_raw)
-    creds = service_account.Credentials.from_service_account_info(
+    return service_account.Credentials.from_service_account_info(
         sa, scopes=["https://www.googleapis.com/auth/drive"]
     )
-    return build("drive", "v3", credentials=creds)
+
+def new_authed_http(creds=None):
+    """A fresh authorized transport. httplib2.Http is not thread-safe: one per thread."""
+    return google_auth_httplib2.AuthorizedHttp(creds or get_credentials(),
+                                               http=httplib2.Http(timeout=60))
+
+@st.cache_resource
+def get_drive():
+    # same transport build(credentials=...) would make, but with a 60s socket timeout;
+    # the bundled discovery doc is used as-is (no fetch, no file-cache probe)
+    return build("drive", "v3", http=new_authed_http(),
+                 cache_discovery=False, static_discovery=True)
 
 drive = get_drive()
 
+# ---- Background I/O: shared pool, one Drive transport per worker thread ----
+@st.cache_resource
+def get_io_pool() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="drive-io")
+
+@st.cache_resource
+def _io_thread_state() -> threading.local:
+    return threading.local()
+
+def submit_io(fn, *args) -> Future:
+    """Run fn(*args, http=<per-thread transport>) on the shared pool; safe off the script thread."""
+    creds, tls = get_credentials(), _io_thread_state()
+    def _run():
+        http = getattr(tls, "http", None)
+        if http is None:
+            http = tls.http = new_authed_http(creds)
+        return fn(*args, http=http)
+    return get_io_pool().submit(_run)
+
+@st.cache_resource
+def get_http_session() -> requests.Session:
+    """Pooled keep-alive session for non-API fetches (thumbnail links)."""
+    s = requests.Session()
+    adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32)
+    s.mount("https://", adapter)
+    s.headers["Connection"] = "keep-alive"
+    s.headers["User-Agent"] += " (gzip)"  # Drive only compresses responses for a gzip-tagged UA
+    return s
+
+# ---- Request pacing: one token bucket shared by every thread in the process ----
+_MAX_QPS = 20.0
+
+@st.cache_resource
+def _qps_bucket() -> Tuple[threading.Lock, List[float]]:
+    return threading.Lock(), [_MAX_QPS, time.monotonic()]  # [tokens, last refill]
+
+def _qps_guard(bucket):
+    """Block until a request token is available; bursts up to _MAX_QPS pass immediately."""
+    lock, b = bucket
+    with lock:
+        now = time.monotonic()
+        b[0] = min(_MAX_QPS, b[0] + (now - b[1]) * _MAX_QPS)
+        b[1] = now
+        wait = (1.0 - b[0]) / _MAX_QPS if b[0] < 1.0 else 0.0
+        b[0] -= 1.0  # may go negative: queued callers wait behind the debt
+    if wait: time.sleep(wait)
+
+_qps = _qps_bucket()  # resolved on the script thread; workers only read the global
+
 def _retry_sleep(attempt: int):
     time.sleep(min(1.5 * (2 ** attempt), 6.0))
 
-_inproc_text_cache: Dict[str, str] = {}
+_inproc_blob_cache: Dict[str, bytes] = {}
+
+_MEDIA_URL = "https://www.googleapis.com/drive/v3/files/{}?alt=media&supportsAllDrives=true"
 
-def _download_bytes_with_retry(drive, file_id: str, attempts: int = 6) -> bytes:
+@st.cache_resource
+def _token_lock() -> threading.Lock:
+    return threading.Lock()
+
+def _direct_media_get(file_id: str, creds, session: requests.Session, lock: threading.Lock) -> bytes:
+    """One GET on the pooled session: no MediaIoBaseDownload chunk loop, no extra client layers."""
+    if not creds.valid:
+        with lock:  # one refresh even when several workers notice the expiry together
+            if not creds.valid:
+                creds.refresh(GoogleAuthRequest(session))
+    r = session.get(_MEDIA_URL.format(file_id),
+                    headers={"Authorization": f"Bearer {creds.token}"}, timeout=30)
+    r.raise_for_status()
+    return r.content
+
+# resolved on the script thread so worker threads can download without st.* calls
+_media = (get_credentials(), get_http_session(), _token_lock())
+
+def _download_bytes_with_retry(drive, file_id: str, attempts: int = 6, http=None) -> bytes:
+    # every thread uses the direct GET; `http` is accepted so submit_io can call this as-is
     last_err = None
     for i in range(attempts):
+        _qps_guard(_qps)  # once per request
         try:
-            req = drive.files().get_media(fileId=file_id, supportsAllDrives=True)
-            buf = io.BytesIO()
-            dl = MediaIoBaseDownload(buf, req)
-            done = False
-            while not done:
-                _, done = dl.next_chunk()
-            buf.seek(0)
-            return buf.read()
+            return _direct_media_get(file_id, *_media)
         except (HttpError, ssl.SSLError, ConnectionError, requests.RequestException) as e:
+            status = getattr(getattr(e, "response", None), "status_code", None)
+            if status is not None and 400 <= status < 500 and status not in (408, 429):
+                raise  # not found / forbidden: retrying only delays the error
             last_err = e
             _retry_sleep(i)
     raise last_err
 
-def read_text_from_drive(drive, file_id: str) -> str:
+# ---- Gzip at rest: reads detect the magic bytes, rewrites keep each file's format ----
+_GZ_MAGIC = b"\x1f\x8b"
+
+@st.cache_resource
+def _gz_files() -> set:
+    return set()
+
+def _gzip_logs_enabled() -> bool:
+    """Opt-in (app.gzip_logs): convert plain master logs to gzip on their next rewrite."""
+    try:
+        return bool(st.secrets.get("app", {}).get("gzip_logs", False))
+    except Exception:
+        return False
+
+def _gunzip_if_needed(data: bytes) -> Tuple[bytes, bool]:
+    if data[:2] == _GZ_MAGIC:
+        return gzip.decompress(data), True
+    return data, False
+
+def _encode_blob(data: bytes, gz: bool) -> Tuple[bytes, str]:
+    if gz:
+        return gzip.compress(data, compresslevel=3), "application/gzip"
+    return data, "text/plain"
+
+def _settle_blob_checked(file_id: str, fetch) -> Tuple[bytes, bool]:
+    """Finish a read started by fetch(): gunzip, remember the format, fall back to the last copy.
+    The flag is False when that last copy stood in for a failed read."""
     try:
-        data = _download_bytes_with_retry(drive, file_id)
-        text = data.decode("utf-8", errors="ignore")
-        _inproc_text_cache[file_id] = text
-        return text
+        data, gz = _gunzip_if_needed(fetch())
+        if gz: _gz_files().add(file_id)
+        _inproc_blob_cache[file_id] = data
+        return data, True
     except Exception:
-        cached = _inproc_text_cache.get(file_id)
+        cached = _inproc_blob_cache.get(file_id)
         if cached is not None:
             st.info("Drive read hiccup — used cached log contents; UI stays responsive.")
-            return cached
+            return cached, False
         raise
 
-def write_text_to_drive(drive, file_id: str, text: str):
-    media = MediaIoBaseUpload(io.BytesIO(text.encode("utf-8")),
-                              mimetype="text/plain", resumable=False)
-    drive.files().update(fileId=file_id, media_body=media,
-                         supportsAllDrives=True).execute()
-    _inproc_text_cache[file_id] = text
-
-def append_lines_to_drive_text(drive, file_id: str, new_lines: List[str], retries: int = 3):
+def _settle_blob(file_id: str, fetch) -> bytes:
+    return _settle_blob_checked(file_id, fetch)[0]
+
+def read_bytes_from_drive(drive, file_id: str) -> bytes:
+    return _settle_blob(file_id, lambda: _download_bytes_with_retry(drive, file_id))
+
+def write_text_to_drive(drive, file_id: str, text: Union[str, bytes], gz: Optional[bool] = None) -> str:
+    """Overwrite a file's content; returns its new modifiedTime."""
+    data = text if isinstance(text, bytes) else text.encode("utf-8")
+    if gz is None:
+        gz = file_id in _gz_files()
+    payload, mimetype = _encode_blob(data, gz)
+    media = MediaIoBaseUpload(io.BytesIO(payload), mimetype=mimetype, resumable=False)
+    resp = drive.files().update(fileId=file_id, media_body=media, fields="id,modifiedTime",
+                                supportsAllDrives=True).execute()
+    _inproc_blob_cache[file_id] = data
+    return resp.get("modifiedTime", "")
+
+def append_lines_to_drive_text(drive, file_id: str, new_lines: List[bytes], retries: int = 3):
+    """
+    Full-file append, only for logs without a parent folder (no delta files). The content is
+    downloaded only when the master moved since the cached copy was taken, and the upload is
+    retried if anyone wrote the file after that check.
+    """
+    last_err: Exception = RuntimeError(f"Append to log {file_id} failed")
     for attempt in range(retries):
         try:
-            prev = read_text_from_drive(drive, file_id)
-            updated = prev + "".join(new_lines)
-            write_text_to_drive(drive, file_id, updated)
+            state = _file_mtime(file_id)
+            held = _log_parts().get(file_id) or {}
+            if held.get("mtime") == state:
+                prev = held["master"]
+            else:
+                prev, fresh = _settle_blob_checked(file_id, lambda: _download_bytes_with_retry(drive, file_id))
+                if not fresh:
+                    raise RuntimeError(f"Could not read log {file_id}")  # never append to a stale copy
+            updated = prev + b"".join(new_lines)
+            if _file_mtime(file_id) != state:
+                raise RuntimeError(f"Log {file_id} changed during the append")
+            mtime = write_text_to_drive(drive, file_id, updated,
+                                        gz=file_id in _gz_files() or _gzip_logs_enabled())
+            _log_parts()[file_id] = {"mtime": mtime, "master": updated, "deltas": {}}
             return
-        except Exception:
+        except Exception as e:
+            last_err = e
             _retry_sleep(attempt)
-    prev = _inproc_text_cache.get(file_id, "")
-    updated = prev + "".join(new_lines)
-    write_text_to_drive(drive, file_id, updated)
-
-def find_file_id_in_folder(drive, folder_id: str, filename: str) -> Optional[str]:
-    if not filename: return None
-    q = f"'{folder_id}' in parents and name = '{filename}' and trashed = false"
-    resp = drive.files().list(
-        q=q, spaces="drive", fields="files(id,name,mimeType,shortcutDetails)", pageSize=10,
-        supportsAllDrives=True, includeItemsFromAllDrives=True, corpora="allDrives"
-    ).execute()
-    files = resp.get("files", [])
-    return files[0]["id"] if files else None
+    raise last_err  # a blind write of the last local copy would drop other writers' lines
+
+def _q_escape(value: str) -> str:
+    """Escape a literal for use inside a single-quoted Drive `q` string."""
+    return str(value).replace("\\", "\\\\").replace("'", "\\'")
+
+def _list_scope_kwargs() -> Dict[str, Any]:
+    """Route files.list to one shared drive's index when `gcp.shared_drive_id` is set."""
+    drive_id = _GCP.get("shared_drive_id")
+    if drive_id:
+        return {"corpora": "drive", "driveId": drive_id}
+    return {"corpora": "allDrives"}
+
+# ---- Source-folder lookups (static during a session, safe to cache) ----
+_FOLDER_INDEX_THRESHOLD = 16
+
+def _list_folder_index_uncached(folder_id: str, http=None) -> Dict[str, str]:
+    index: Dict[str, str] = {}
+    q = f"'{_q_escape(folder_id)}' in parents and trashed = false"
+    token = None
+    while True:
+        resp = drive.files().list(
+            q=q, spaces="drive", fields="nextPageToken,files(id,name)", pageSize=1000,
+            pageToken=token, supportsAllDrives=True, includeItemsFromAllDrives=True,
+            **_list_scope_kwargs()
+        ).execute(http=http)
+        for f in resp.get("files", []):
+            index.setdefault(f["name"], f["id"])
+        token = resp.get("nextPageToken")
+        if not token:
+            return index
+
+_FOLDER_INDEX_TTL = 3600
+
+@st.cache_resource
+def _warm_indexes() -> Dict[str, Tuple[float, Future]]:
+    return {}
+
+def _warm_index_future(folder_id: str) -> Optional[Future]:
+    hit = _warm_indexes().get(folder_id)
+    if hit and time.time() - hit[0] < _FOLDER_INDEX_TTL:
+        return hit[1]
+    return None
+
+def _warm_index_ready(folder_id: str) -> bool:
+    fut = _warm_index_future(folder_id)
+    return fut is not None and fut.done() and fut.exception() is None
+
+def warm_folder_indexes(folder_ids: List[Optional[str]]):
+    """Start listing source folders in the background; list_folder_index picks the results up."""
+    warm = _warm_indexes()
+    for fid in dict.fromkeys(folder_ids):
+        if fid and _warm_index_future(fid) is None:
+            warm[fid] = (time.time(), submit_io(_list_folder_index_uncached, fid))
+
+@st.cache_resource(show_spinner=False, ttl=_FOLDER_INDEX_TTL)
+def list_folder_index(folder_id: str) -> Dict[str, str]:
+    fut = _warm_index_future(folder_id)
+    if fut is not None:
+        try:
+            return fut.result()
+        except Exception:
+            pass
+    return _list_folder_index_uncached(folder_id)
+
+# ---- Folder index sidecar: {name: id} JSON kept on Drive for fast cold starts ----
+_INDEX_SIDECAR_MAX_AGE = 3600
+
+@st.cache_resource
+def _sidecar_refreshing() -> set:
+    return set()
+
+def _rfc3339_ts(value: Optional[str]) -> float:
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except Exception:
+        return 0.0
+
+def _refresh_index_sidecar(folder_id: str, sidecar_id: str, inflight: set, http=None):
+    """Re-list the folder and overwrite its sidecar (no st.* calls: runs on the pool)."""
+    try:
+        index = _list_folder_index_uncached(folder_id, http=http)
+        media = MediaIoBaseUpload(io.BytesIO(_json_bytes(index)),
+                                  mimetype="application/json", resumable=False)
+        drive.files().update(fileId=sidecar_id, media_body=media, fields="id",
+                             supportsAllDrives=True).execute(http=http)
+    except Exception:
+        pass
+    finally:
+        inflight.discard(sidecar_id)
+
+@st.cache_resource(show_spinner=False, ttl=3600)
+def load_folder_index_cached(folder_id: str, sidecar_id: Optional[str]) -> Dict[str, str]:
+    """Read the sidecar index (one small download); refresh it in the background if stale."""
+    if not sidecar_id:
+        return list_folder_index(folder_id)
+    try:
+        meta = drive.files().get(fileId=sidecar_id, fields="modifiedTime",
+                                 supportsAllDrives=True).execute()
+        index = _json_loads(read_bytes_from_drive(drive, sidecar_id) or b"{}")
+    except Exception:
+        meta, index = {}, {}
+    stale = time.time() - _rfc3339_ts(meta.get("modifiedTime")) > _INDEX_SIDECAR_MAX_AGE
+    inflight = _sidecar_refreshing()
+    if (stale or not index) and sidecar_id not in inflight:
+        inflight.add(sidecar_id)
+        submit_io(_refresh_index_sidecar, folder_id, sidecar_id, inflight)
+    return index or list_folder_index(folder_id)
+
+_NAME_QUERY_CHUNK = 50  # names per disjunctive query; keeps the q string well under URL limits
+
+def find_file_ids_in_folders(drive, pairs: List[Tuple[str, str]]) -> Dict[Tuple[str, str], str]:
+    """
+    Resolve many (folder_id, filename) pairs at once: one `name = .. or name = ..` list
+    per folder (chunked), all sent in a single batched request. Unknown names are absent.
+    """
+    by_folder: Dict[str, List[str]] = {}
+    for folder_id, name in pairs:
+        names = by_folder.setdefault(folder_id, [])
+        if name and name not in names:
+            names.append(name)
+    found: Dict[Tuple[str, str], str] = {}
+    errors: List[Exception] = []
+    def _cb(request_id, response, exception):
+        if exception is not None:
+            errors.append(exception); return
+        folder_id = request_id.rpartition(":")[0]
+        for f in response.get("files", []):
+            found.setdefault((folder_id, f["name"]), f["id"])
+    batch = drive.new_batch_http_request(callback=_cb)
+    queued = 0
+    for folder_id, names in by_folder.items():
+        for k in range(0, len(names), _NAME_QUERY_CHUNK):
+            names_q = " or ".join(f"name = '{_q_escape(n)}'" for n in names[k:k + _NAME_QUERY_CHUNK])
+            batch.add(drive.files().list(
+                q=f"'{_q_escape(folder_id)}' in parents and ({names_q}) and trashed = false",
+                spaces="drive", fields="files(id,name)", pageSize=1000,
+                supportsAllDrives=True, includeItemsFromAllDrives=True, **_list_scope_kwargs()
+            ), request_id=f"{folder_id}:{k}")
+            queued += 1
+    if queued: batch.execute()
+    if errors: raise errors[0]
+    return found
+
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=4096)
+def _cached_file_ids(pairs: Tuple[Tuple[str, str], ...]) -> Dict[Tuple[str, str], str]:
+    return find_file_ids_in_folders(drive, list(pairs))
+
+def source_file_ids(lookups: List[Tuple[str, str, Optional[str]]]) -> Dict[Tuple[str, str], Optional[str]]:
+    """
+    Resolve (folder_id, filename, sidecar_id) lookups, keyed by (folder_id, filename).
+    Busy or pre-warmed folders use the folder index; the rest go out as one batched name query.
+    """
+    counts = st.session_state.setdefault("_folder_lookups", {})
+    out: Dict[Tuple[str, str], Optional[str]] = {}
+    misses = set()
+    for folder_id, filename, sidecar_id in lookups:
+        if not filename: continue
+        counts[folder_id] = counts.get(folder_id, 0) + 1
+        if sidecar_id or counts[folder_id] > _FOLDER_INDEX_THRESHOLD or _warm_index_ready(folder_id):
+            fid = load_folder_index_cached(folder_id, sidecar_id).get(filename)
+            if fid:
+                out[(folder_id, filename)] = fid; continue
+        misses.add((folder_id, filename))
+    if misses:
+        out.update(_cached_file_ids(tuple(sorted(misses))))
+    return out
+
+_ID_WINDOW = (1, 8)  # rows behind / ahead of the current one resolved per batched lookup
+_PREFETCH_AHEAD = 2  # pairs after the current one whose previews are warmed in the background
+
+def _pair_lookups(cfg: Dict[str, Any], rows: List[Dict[str, Any]]) -> List[Tuple[str, str, Optional[str]]]:
+    out = []
+    for e in rows:
+        out.append((cfg["src_hypo"], e.get("hypo_id", ""), cfg.get("idx_hypo")))
+        out.append((cfg["src_adv"], e.get("adversarial_id", ""), cfg.get("idx_adv")))
+    return out
+
+def ensure_id_window(cfg: Dict[str, Any], meta: List[Dict[str, Any]], i: int) -> Dict[Tuple[str, str], Optional[str]]:
+    """
+    Session map (folder_id, filename) -> file id. When the current or next pair is not
+    in it yet, resolve rows i-1 .. i+8 together, so most navigations need no lookup at all.
+    """
+    cache = st.session_state.setdefault("_id_cache", {})
+    if any(n and (f, n) not in cache for f, n, _ in _pair_lookups(cfg, meta[i:i + 2])):
+        window = _pair_lookups(cfg, meta[max(0, i - _ID_WINDOW[0]):i + _ID_WINDOW[1] + 1])
+        found = source_file_ids(window)
+        for f, n, _ in window:
+            if n: cache[(f, n)] = found.get((f, n))  # misses too, so they are not re-queried
+    return cache
 
 def delete_file_by_id(drive, file_id: Optional[str]):
     if not file_id: return
@@ -150,58 +495,676 @@ def delete_file_by_id(drive, file_id: Optional[str]):
     except HttpError:
         pass
 
-def create_shortcut_to_file(drive, src_file_id: str, new_name: str, dest_folder_id: str) -> str:
-    meta = {
+def _shortcut_body(src_file_id: str, new_name: str, dest_folder_id: str) -> Dict[str, Any]:
+    return {
         "name": new_name,
         "mimeType": "application/vnd.google-apps.shortcut",
         "parents": [dest_folder_id],
         "shortcutDetails": {"targetId": src_file_id},
     }
-    res = drive.files().create(body=meta, fields="id,name",
-                               supportsAllDrives=True).execute()
-    return res["id"]
+
+def batch_shortcut_updates(drive, delete_ids: List[Optional[str]],
+                           creates: Dict[str, Tuple[str, str, str]]) -> Dict[str, str]:
+    """
+    Run shortcut deletes and creates in one batched HTTP request.
+    `creates` maps a caller key to (src_file_id, name, dest_folder_id); returns {key: new_id}.
+    Delete failures are ignored like delete_file_by_id; the first create failure is raised.
+    """
+    delete_ids = list(dict.fromkeys(f for f in delete_ids if f))
+    created: Dict[str, str] = {}
+    if not delete_ids and not creates:
+        return created
+    errors: List[Exception] = []
+    def _cb(request_id, response, exception):
+        kind, _, key = request_id.partition(":")
+        if kind != "create": return
+        if exception is not None: errors.append(exception)
+        else: created[key] = response["id"]
+    batch = drive.new_batch_http_request(callback=_cb)
+    for n, fid in enumerate(delete_ids):
+        batch.add(drive.files().delete(fileId=fid, supportsAllDrives=True), request_id=f"delete:{n}")
+    for key, (src, name, dst) in creates.items():
+        batch.add(drive.files().create(body=_shortcut_body(src, name, dst), fields="id",
+                                       supportsAllDrives=True), request_id=f"create:{key}")
+    batch.execute()
+    if errors: raise errors[0]
+    return created
+
+# ---- Delta logs: one small file per session and log, folded into the master by one compactor ----
+# Next to each log on Drive, every session keeps `<log_id>.delta_<session>.jsonl` and rewrites it
+# on each save. The compactor appends it to the log and deletes it once it holds _DELTA_FOLD_ROWS
+# rows, on a category switch, or (sessions that ended) after _DELTA_IDLE_SECS without a write.
+_DELTA_FOLD_ROWS = 100
+_DELTA_IDLE_SECS = 3600
+_DELTA_MIMETYPE = "application/x-ndjson"
+_FOLD_ATTEMPTS = 3
+
+def _session_token() -> str:
+    tok = st.session_state.get("_session_token")
+    if not tok:
+        tok = st.session_state._session_token = uuid.uuid4().hex[:12]
+    return tok
+
+def _delta_prefix(log_id: str) -> str:
+    return f"{log_id}.delta_"
+
+@st.cache_resource
+def _log_parent_cache() -> Dict[str, Optional[str]]:
+    return {}
+
+def log_parents(log_ids: List[str]) -> Dict[str, Optional[str]]:
+    """
+    Parent folder per log; unknown ones are looked up together in one batched request.
+    None means the log has no parent folder. A failed lookup is left out of the result
+    (callers must not mistake it for "no parent") and is retried on the next call.
+    """
+    cache = _log_parent_cache()
+    missing = [lid for lid in dict.fromkeys(log_ids) if lid and lid not in cache]
+    if missing:
+        def _cb(request_id, response, exception):
+            if exception is None:
+                cache[request_id] = (response.get("parents") or [None])[0]
+        batch = drive.new_batch_http_request(callback=_cb)
+        for lid in missing:
+            batch.add(drive.files().get(fileId=lid, fields="parents", supportsAllDrives=True),
+                      request_id=lid)
+        try:
+            batch.execute()
+        except Exception:
+            pass
+    return {lid: cache[lid] for lid in log_ids if lid in cache}
+
+def _log_parent(log_id: str) -> Optional[str]:
+    parents = log_parents([log_id])
+    if log_id not in parents:
+        raise RuntimeError(f"Could not resolve the parent folder of log {log_id}")
+    return parents[log_id]
+
+def _delete_quietly(file_id: str, http=None):
+    try:
+        drive.files().delete(fileId=file_id, supportsAllDrives=True).execute(http=http)
+    except HttpError:
+        pass  # already gone
+
+def _file_mtime(file_id: str, http=None) -> str:
+    return drive.files().get(fileId=file_id, fields="modifiedTime",
+                             supportsAllDrives=True).execute(http=http).get("modifiedTime", "")
+
+@st.cache_resource
+def _compactor() -> Tuple[threading.Lock, set, set]:
+    """Process-wide fold lock, delta ids queued for a fold, delta ids already in their master."""
+    return threading.Lock(), set(), set()
+
+_fold_lock, _folding, _folded = _compactor()  # resolved on the script thread; workers only read the globals
+
+def _fold_delta(log_id: str, delta_id: str, buf: Optional[bytes], mtime: str = "", gz: bool = False, http=None):
+    """
+    Append one delta to its master log, then delete it (no st.* calls: runs on the pool).
+    Folds never overlap within the process, and the upload is redone on a newer master if the
+    log changed since it was read. buf=None downloads the delta first (another session's); with
+    `mtime` set, a delta its session rewrote meanwhile is left for the next sweep. On failure the
+    delta stays where it is and readers keep merging it.
+    """
+    try:
+        with _fold_lock:
+            if delta_id not in _folded:  # folded ids only need their delete retried
+                if buf is None:
+                    buf = _gunzip_if_needed(_download_bytes_with_retry(drive, delta_id, http=http))[0]
+                for _ in range(_FOLD_ATTEMPTS):
+                    state = _file_mtime(log_id, http)
+                    master, was_gz = _gunzip_if_needed(_download_bytes_with_retry(drive, log_id, http=http))
+                    if master and not master.endswith(b"\n"):
+                        master += b"\n"
+                    payload, mimetype = _encode_blob(master + buf, gz or was_gz)
+                    if _file_mtime(log_id, http) != state:
+                        continue  # written since our read: fold into the newer master instead
+                    media = MediaIoBaseUpload(io.BytesIO(payload), mimetype=mimetype, resumable=False)
+                    drive.files().update(fileId=log_id, media_body=media, fields="id",
+                                         supportsAllDrives=True).execute(http=http)
+                    break
+                else:
+                    return
+                if mtime and _file_mtime(delta_id, http) != mtime:
+                    return
+                _folded.add(delta_id)  # readers skip it from here on, even if the delete fails
+            _delete_quietly(delta_id, http)
+    except Exception:
+        pass
+    finally:
+        _folding.discard(delta_id)
+
+def _schedule_fold(log_id: str, delta_id: str, buf: Optional[bytes] = None, mtime: str = "", gz: bool = False):
+    if delta_id not in _folding:
+        _folding.add(delta_id)
+        submit_io(_fold_delta, log_id, delta_id, buf, mtime, gz)
+
+def _fold_session_delta(log_id: str):
+    """Hand this session's delta on a log to the compactor; the next save starts a new one."""
+    d = st.session_state.get("_delta_files", {}).pop(log_id, None)
+    if d:
+        _schedule_fold(log_id, d["id"], d["buf"], "", _gzip_logs_enabled())
+
+def flush_session_deltas(log_ids: List[Optional[str]]):
+    """Fold this session's deltas on the given logs now (category switch) instead of when full."""
+    for lid in log_ids:
+        if lid: _fold_session_delta(lid)
+
+def sweep_idle_deltas(versions: Dict[str, str]):
+    """Fold deltas whose session stopped writing, and retry deletes of ones already folded."""
+    own = {d["id"] for d in st.session_state.get("_delta_files", {}).values()}
+    now, gz = time.time(), _gzip_logs_enabled()
+    for lid, version in versions.items():
+        for fid, mtime in _version_deltas(version) or []:
+            if fid in _folded or (fid not in own and now - _rfc3339_ts(mtime) >= _DELTA_IDLE_SECS):
+                _schedule_fold(lid, fid, None, mtime, gz)
+
+def _write_delta(parent: str, name: str, file_id: Optional[str], buf: bytes, http=None) -> str:
+    """Overwrite a session's delta, creating it first if needed (or if it was folded away); returns its id."""
+    if file_id:
+        media = MediaIoBaseUpload(io.BytesIO(buf), mimetype=_DELTA_MIMETYPE, resumable=False)
+        try:
+            return drive.files().update(fileId=file_id, media_body=media, fields="id",
+                                        supportsAllDrives=True).execute(http=http)["id"]
+        except HttpError as e:
+            if getattr(e.resp, "status", None) != 404:
+                raise
+    media = MediaIoBaseUpload(io.BytesIO(buf), mimetype=_DELTA_MIMETYPE, resumable=False)
+    body = {"name": name, "parents": [parent], "mimeType": _DELTA_MIMETYPE}
+    return drive.files().create(body=body, media_body=media, fields="id",
+                                supportsAllDrives=True).execute(http=http)["id"]
+
+def append_logs(entries: List[Tuple[str, List[bytes]]]):
+    """
+    Append lines to several logs at once by rewriting this session's delta on each (a few KB,
+    never the master). Media uploads cannot share a batch request, so the writes run on the
+    I/O pool: one upload RTT per save. Raises the first failure once every write has settled.
+    """
+    grouped: Dict[str, List[bytes]] = {}
+    for log_id, lines in entries:
+        grouped.setdefault(log_id, []).extend(lines)
+    files = st.session_state.setdefault("_delta_files", {})  # log_id -> {"id", "buf"}
+    pending: Dict[str, Tuple[bytes, Future]] = {}
+    fallback: List[str] = []
+    parents = log_parents(list(grouped))
+    errors: List[Exception] = []
+    for log_id, lines in grouped.items():
+        if log_id not in parents:  # lookup failed: the full-file fallback would race the compactor
+            errors.append(RuntimeError(f"Could not resolve the parent folder of log {log_id}")); continue
+        parent = parents[log_id]
+        if not parent:
+            fallback.append(log_id); continue
+        d = files.get(log_id) or {}
+        buf = d.get("buf", b"") + b"".join(lines)
+        name = f"{_delta_prefix(log_id)}{_session_token()}.jsonl"
+        pending[log_id] = (buf, submit_io(_write_delta, parent, name, d.get("id"), buf))
+    for log_id, (buf, fut) in pending.items():
+        try:
+            files[log_id] = {"id": fut.result(), "buf": buf}
+        except Exception as e:
+            errors.append(e); continue
+        if buf.count(b"\n") >= _DELTA_FOLD_ROWS:
+            _fold_session_delta(log_id)
+    for log_id in fallback:
+        try:
+            append_lines_to_drive_text(drive, log_id, grouped[log_id])
+        except Exception as e:
+            errors.append(e)
+    if errors: raise errors[0]
+
+def _delta_list_request(log_id: str, parent: str, page_token: Optional[str] = None):
+    """One page of a log's delta listing, oldest first (callers follow nextPageToken)."""
+    return drive.files().list(
+        q=f"'{_q_escape(parent)}' in parents and name contains '{_q_escape(_delta_prefix(log_id))}' and trashed = false",
+        spaces="drive", fields="nextPageToken, files(id,name,modifiedTime)", orderBy="createdTime",
+        pageSize=1000, pageToken=page_token,
+        supportsAllDrives=True, includeItemsFromAllDrives=True, **_list_scope_kwargs()
+    )
+
+def _listed_deltas(log_id: str, resp: Dict[str, Any]) -> List[Dict[str, Any]]:
+    prefix = _delta_prefix(log_id)
+    return [f for f in resp.get("files", []) if f["name"].startswith(prefix)]
+
+def _log_deltas(log_id: str) -> List[Tuple[str, str]]:
+    """(id, modifiedTime) of every delta of a log, oldest first. Raises if the parent or any page cannot be read."""
+    parent = _log_parent(log_id)
+    listed: List[Tuple[str, str]] = []
+    token = None
+    while parent:
+        resp = _delta_list_request(log_id, parent, token).execute()
+        listed += [(f["id"], f.get("modifiedTime", "")) for f in _listed_deltas(log_id, resp)]
+        token = resp.get("nextPageToken")
+        if not token: break
+    return listed
+
+def _version_deltas(version: str) -> Optional[List[Tuple[str, str]]]:
+    """(id, modifiedTime) of the deltas listed by log_versions, in creation order; None if the probe failed."""
+    if not version or version.startswith("?"):
+        return None
+    listed = version.partition("|")[2]
+    return [(d.partition("@")[0], d.partition("@")[2]) for d in listed.split(",") if d]
+
+# ---- Log pieces: a master or a delta is reused while its modifiedTime holds ----
+@st.cache_resource
+def _log_parts() -> Dict[str, Dict[str, Any]]:
+    return {}  # log_id -> {"mtime": str, "master": bytes, "deltas": {delta_id: (mtime, bytes)}}
+
+def read_logs_bytes(log_ids: List[str], versions: Optional[Dict[str, str]] = None) -> Dict[str, Tuple[bytes, bool]]:
+    """
+    Master log plus every unfolded delta, as (JSONL bytes, complete) per log.
+    Only the pieces the version token says changed are downloaded, all concurrently on the
+    I/O pool; deltas come from the tokens when given, so only logs without one pay for
+    a listing. Deltas this process already folded are skipped. `complete` is False when the listing or any download failed: such bytes
+    must not be cached.
+    """
+    versions, pieces = versions or {}, _log_parts()
+    masters: Dict[str, Future] = {}  # only logs whose master moved
+    deltas: Dict[str, Optional[List[Tuple[str, str, Optional[Future]]]]] = {}
+    mtimes: Dict[str, str] = {}
+    prevs: Dict[str, Dict[str, Any]] = {}  # snapshot: other sessions may replace entries meanwhile
+    for lid in log_ids:
+        v, prev = versions.get(lid, ""), pieces.get(lid) or {}
+        prevs[lid] = prev
+        mtimes[lid] = "" if v.startswith("?") else v.partition("|")[0]
+        if not (mtimes[lid] and prev.get("mtime") == mtimes[lid]):
+            masters[lid] = submit_io(_download_bytes_with_retry, drive, lid)
+        listed = _version_deltas(v)
+        try:
+            listed = _log_deltas(lid) if listed is None else listed
+        except Exception:
+            deltas[lid] = None; continue
+        known = prev.get("deltas", {})
+        deltas[lid] = [(fid, mt, None if mt and known.get(fid, ("",))[0] == mt
+                        else submit_io(_download_bytes_with_retry, drive, fid))
+                       for fid, mt in listed if fid not in _folded]
+    out: Dict[str, Tuple[bytes, bool]] = {}
+    for lid in log_ids:
+        prev = prevs[lid]
+        if lid in masters:
+            master, complete = _settle_blob_checked(lid, masters[lid].result)
+        else:
+            master, complete = prev["master"], True
+        got: Dict[str, Tuple[str, bytes]] = {}
+        if deltas[lid] is None:
+            complete = False
+        for fid, mt, fut in deltas[lid] or []:
+            try:
+                got[fid] = prev["deltas"][fid] if fut is None else (mt, _gunzip_if_needed(fut.result())[0])
+            except Exception:
+                complete = False  # e.g. folded and deleted after our (older) master read
+        if complete and mtimes[lid]:
+            pieces[lid] = {"mtime": mtimes[lid], "master": master, "deltas": got}  # unlisted deltas drop out
+        out[lid] = (b"\n".join([master, *(b for _, b in got.values())]), complete)
+    return out
+
+def read_log_bytes(log_id: str, version: str = "") -> Tuple[bytes, bool]:
+    return read_logs_bytes([log_id], {log_id: version})[log_id]
+
+# ---- Raw log bytes by version (memory, then disk): one concurrent fetch feeds every reader of a rerun ----
+@st.cache_resource
+def _log_raw_cache() -> Dict[str, Tuple[str, bytes]]:
+    return {}
+
+def _log_disk(version: str):
+    """Disk tier for log bytes; only real version tokens key it (a '?' token is never reused)."""
+    return _disk_blobs() if version and not version.startswith("?") else None
+
+def _remember_log(log_id: str, version: str, raw: bytes):
+    if version:
+        _log_raw_cache()[log_id] = (version, raw)
+    disk = _log_disk(version)
+    if disk is not None:  # one entry per log, overwritten as the version moves
+        disk.set(("log", log_id), (version, raw), expire=_DISK_BLOB_TTL)
+
+def _log_from_disk(log_id: str, version: str) -> Optional[bytes]:
+    disk = _log_disk(version)
+    hit = disk.get(("log", log_id)) if disk is not None else None
+    if not hit or hit[0] != version:
+        return None
+    _log_raw_cache()[log_id] = hit
+    return hit[1]
+
+def warm_log_bytes(versions: Dict[str, str]) -> Dict[str, str]:
+    """
+    Fetch every log whose version moved, with all downloads in flight together, and return
+    the version each log's bytes are cached under. An incomplete read is kept only under a
+    one-off '?' token, so nothing keyed by the real version can pin it.
+    """
+    sweep_idle_deltas(versions)
+    cache, held = _log_raw_cache(), dict(versions)
+    stale = [lid for lid, v in versions.items()
+             if cache.get(lid, ("",))[0] != v and _log_from_disk(lid, v) is None]
+    if stale:
+        for lid, (raw, complete) in read_logs_bytes(stale, versions).items():
+            if complete:
+                _remember_log(lid, versions[lid], raw)
+            else:
+                held[lid] = f"?{time.time()}"
+                cache[lid] = (held[lid], raw)
+    return held
+
+def log_bytes_at(log_id: str, version: str) -> bytes:
+    hit = _log_raw_cache().get(log_id)
+    if version and hit and hit[0] == version:
+        return hit[1]
+    raw = _log_from_disk(log_id, version)
+    if raw is None:
+        raw, complete = read_log_bytes(log_id, version)
+        if complete:
+            _remember_log(log_id, version, raw)
+    return raw
 
 # ---- Click throttle ----
-def _cooldown_key(action_key: str) -> str:
-    return f"_next_ok_{action_key}"
+_BTN_NAMES = ("acc_h", "rej_h", "acc_a", "rej_a", "prev", "save", "next")
+
+def btn_keys(pk: str) -> Dict[str, str]:
+    """Widget keys for a pair, built once per pair and reused across reruns."""
+    cache = st.session_state.setdefault("_btn_keys", {})
+    keys = cache.get(pk)
+    if keys is None:
+        keys = cache[pk] = {n: f"{n}_{pk}" for n in _BTN_NAMES}
+    return keys
 
 def cooldown_disabled(action_key: str) -> bool:
-    import time
-    return time.time() < st.session_state.get(_cooldown_key(action_key), 0.0)
+    cds = st.session_state.get("_cooldowns")
+    if not cds:  # nothing pending: skip the clock read
+        return False
+    return cds.get(action_key, 0.0) > time.monotonic()
 
 def cooldown_start(action_key: str, seconds: float = 0.8):
-    import time
-    st.session_state[_cooldown_key(action_key)] = time.time() + seconds
+    cds = st.session_state.setdefault("_cooldowns", {})
+    now = time.monotonic()
+    for k in [k for k, t in cds.items() if t <= now]:
+        del cds[k]
+    cds[action_key] = now + seconds
+
+# ---- Progress pointer writes (off the click path, deferred retry on quota / 5xx) ----
+_RETRYABLE_STATUS = {429, 500, 503}
+_RETRY_MAX_ATTEMPTS = 6
+
+def _is_retryable(e: Exception) -> bool:
+    if isinstance(e, HttpError):
+        return getattr(e.resp, "status", None) in _RETRYABLE_STATUS
+    return isinstance(e, (ssl.SSLError, ConnectionError, requests.RequestException))
+
+def _queue_progress_retry(pfid: str, idx: int, attempt: int):
+    q = st.session_state.setdefault("retry_queue", [])
+    q[:] = [r for r in q if r[0] != pfid]  # newer pointer supersedes queued one
+    q.append((pfid, idx, time.time() + min(1.5 * (2 ** attempt), 60.0), attempt))
+
+def _upload_progress(pfid: str, idx: int, http=None):
+    """Overwrite one resume pointer (no st.* calls: runs on the pool)."""
+    media = MediaIoBaseUpload(io.BytesIO(str(idx).encode()), mimetype="text/plain", resumable=False)
+    drive.files().update(fileId=pfid, media_body=media, fields="id", supportsAllDrives=True).execute(http=http)
+
+def _submit_progress(pfid: str, idx: int, attempt: int):
+    st.session_state.setdefault("_progress_latest", {})[pfid] = idx
+    fut = submit_io(_upload_progress, pfid, idx)
+    st.session_state.setdefault("_progress_inflight", []).append((pfid, idx, attempt, fut))
+
+def try_write_with_backoff(pfid: str, idx: int):
+    """Fire-and-forget: the upload runs on the I/O pool and a later run settles the outcome."""
+    _submit_progress(pfid, idx, 0)
+
+def _settle_progress_writes():
+    inflight = st.session_state.get("_progress_inflight")
+    if not inflight: return
+    st.session_state._progress_inflight = [w for w in inflight if not w[3].done()]
+    latest = st.session_state.get("_progress_latest", {})
+    persisted = st.session_state.setdefault("_persisted_idx", {})
+    for pfid, idx, attempt, fut in inflight:
+        if not fut.done() or latest.get(pfid) != idx: continue  # superseded by a newer pointer
+        e = fut.exception()
+        if e is None:
+            persisted[pfid] = idx  # only a confirmed write counts as persisted
+        elif _is_retryable(e) and attempt + 1 < _RETRY_MAX_ATTEMPTS:
+            _queue_progress_retry(pfid, idx, attempt + 1)
+        else:
+            latest.pop(pfid, None)  # let the next save try again
+            st.warning(f"Could not save your resume position ({idx + 1}): {e}")
+
+def drain_retry_queue():
+    _settle_progress_writes()
+    q = st.session_state.get("retry_queue")
+    if not q: return
+    now = time.time()
+    st.session_state.retry_queue = []
+    for pfid, idx, due, attempt in q:
+        if due > now:
+            st.session_state.retry_queue.append((pfid, idx, due, attempt)); continue
+        _submit_progress(pfid, idx, attempt)
+
+@st.cache_data(show_spinner=False)
+def _progress_file_id(cat: str, who: str) -> str:
+    parent = _GCP.get("progress_parent_id") or _GCP[f"{cat}_hypo_filtered_log_id"]
+    fname = f"progress_{cat}_{canonical_user(who)}.txt"
+    q = f"'{_q_escape(parent)}' in parents and name = '{_q_escape(fname)}' and trashed = false"
+    resp = drive.files().list(q=q, spaces="drive", fields="files(id)", pageSize=1,
+                              supportsAllDrives=True, includeItemsFromAllDrives=True,
+                              **_list_scope_kwargs()).execute()
+    files = resp.get("files", [])
+    if files: return files[0]["id"]
+    # metadata-only create; the caller's write sets the content
+    meta_tmp = {"name": fname, "parents":[parent], "mimeType":"text/plain"}
+    return drive.files().create(body=meta_tmp, fields="id",
+                                supportsAllDrives=True).execute()["id"]
+
+def persist_progress(idx: int):
+    """Best-effort write of the resume pointer for the current user/category."""
+    try:
+        pfid = _progress_file_id(st.session_state.cat, st.session_state.user)
+    except Exception as e:
+        st.warning(f"Could not save your resume position: {e}"); return
+    latest = st.session_state.get("_progress_latest", {})
+    if idx == latest.get(pfid, st.session_state.get("_persisted_idx", {}).get(pfid)):
+        return  # the newest write already carries this pointer (done, in flight or queued)
+    try_write_with_backoff(pfid, idx)
 
 # ================== Thumbnails / Full-res ===================
-@st.cache_data(show_spinner=False, max_entries=512, ttl=3600)
-def drive_thumbnail_bytes(file_id: str) -> Optional[bytes]:
+_THUMB_LINK_TTL = 3600  # thumbnailLink URLs are short-lived signed links
+_PREVIEW_LRU_CAP = 800  # shared by every session in the process (~50KB each)
+_THUMB_SIZE_RE    = re.compile(r"(=s)\d{2,4}\b")       # ...=s220
+_THUMB_SIZE_Q_RE  = re.compile(r"([&?])s=\d{2,4}\b")   # ...?s=220 / &s=220
+
+def _upgrade_thumb_url(url: str, max_side: int) -> str:
+    """thumbnailLink defaults to 220px; ask Drive for the size we actually display."""
+    return _THUMB_SIZE_Q_RE.sub(rf"\g<1>s={max_side}", _THUMB_SIZE_RE.sub(rf"\g<1>{max_side}", url))
+
+@st.cache_resource
+def _thumb_link_cache() -> Dict[str, Tuple[Optional[str], float]]:
+    return {}
+
+def _fresh_thumb_link(file_id: str) -> Tuple[bool, Optional[str]]:
+    hit = _thumb_link_cache().get(file_id)
+    if hit and time.time() - hit[1] < _THUMB_LINK_TTL:
+        return True, hit[0]
+    return False, None
+
+def prefetch_thumbnail_links(file_ids: List[Optional[str]]):
+    """Resolve thumbnailLink for several files in one batched HTTP round trip."""
+    missing = [f for f in dict.fromkeys(file_ids) if f and not _fresh_thumb_link(f)[0]]
+    if len(missing) < 2:
+        return  # a single lookup is no cheaper batched
+    cache = _thumb_link_cache()
+    def _cb(request_id, response, exception):
+        if exception is None:
+            cache[request_id] = ((response or {}).get("thumbnailLink"), time.time())
     drv = get_drive()
+    batch = drv.new_batch_http_request(callback=_cb)
+    for fid in missing:
+        batch.add(drv.files().get(fileId=fid, fields="thumbnailLink",
+                                  supportsAllDrives=True), request_id=fid)
+    try:
+        batch.execute()
+    except Exception:
+        pass  # drive_thumbnail_bytes falls back to per-file lookups
+
+# The _fetch_* / _encode_* helpers below take their caches and transport as arguments
+# and make no st.* calls, so they can run on the background I/O pool.
+def _fetch_thumbnail(file_id: str, links: Dict, session: requests.Session,
+                     max_side: int = 680, http=None) -> Optional[bytes]:
     try:
-        meta = drv.files().get(fileId=file_id, fields="thumbnailLink",
-                               supportsAllDrives=True).execute()
-        url = meta.get("thumbnailLink")
+        hit = links.get(file_id)
+        if hit and time.time() - hit[1] < _THUMB_LINK_TTL:
+            url = hit[0]
+        else:
+            meta = drive.files().get(fileId=file_id, fields="thumbnailLink",
+                                     supportsAllDrives=True).execute(http=http)
+            url = meta.get("thumbnailLink")
+            links[file_id] = (url, time.time())
         if not url: return None
-        r = requests.get(url, timeout=10)
+        r = session.get(_upgrade_thumb_url(url, max_side), timeout=10)
         if r.ok: return r.content
     except Exception:
         pass
     return None
 
-@st.cache_data(show_spinner=False, max_entries=256, ttl=3600)
-def preview_bytes(file_id: str, max_side: int = 680) -> bytes:
-    tb = drive_thumbnail_bytes(file_id)
-    src = tb if tb is not None else _download_bytes_with_retry(get_drive(), file_id)
+@st.cache_data(show_spinner=False, max_entries=512, ttl=3600)
+def drive_thumbnail_bytes(file_id: str, max_side: int = 680) -> Optional[bytes]:
+    return _fetch_thumbnail(file_id, _thumb_link_cache(), get_http_session(), max_side)
+
+def _vips_preview(src: bytes, max_side: int) -> bytes:
+    im = pyvips.Image.thumbnail_buffer(src, max_side, height=max_side, size="down")
+    if im.hasalpha():
+        im = im.flatten(background=[255, 255, 255])
+    if im.interpretation not in ("srgb", "b-w"):
+        im = im.colourspace("srgb")
+    return im.write_to_buffer(".jpg[Q=88,strip=true]")
+
+_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}  # DHT / JPG / DAC share the range
+
+def jpeg_dims_fast(raw: bytes) -> Optional[Tuple[int, int, int]]:
+    """(width, height, components) from the JPEG SOF segment by walking marker lengths; no decode."""
+    if raw[:2] != b"\xff\xd8":
+        return None
+    pos, n = 2, len(raw)
+    while pos + 4 <= n:
+        if raw[pos] != 0xFF:
+            return None
+        marker = raw[pos + 1]
+        if marker == 0xFF:  # fill byte
+            pos += 1; continue
+        if marker in _SOF_MARKERS:
+            if pos + 10 > n: return None
+            h = int.from_bytes(raw[pos + 5:pos + 7], "big")
+            w = int.from_bytes(raw[pos + 7:pos + 9], "big")
+            return w, h, raw[pos + 9]
+        if marker == 0xDA:  # start of scan: no SOF before the image data
+            return None
+        pos += 2 + int.from_bytes(raw[pos + 2:pos + 4], "big")
+    return None
+
+def _usable_as_is(src: bytes, max_side: int) -> bool:
+    """True for a YCbCr/greyscale JPEG already within max_side."""
+    dims = jpeg_dims_fast(src)
+    return dims is not None and dims[2] in (1, 3) and 0 < max(dims[0], dims[1]) <= max_side
+
+def _encode_preview(src: bytes, max_side: int, from_thumb: bool = False) -> bytes:
+    if from_thumb and _usable_as_is(src, max_side):
+        return src  # Drive already served a display-size JPEG: skip decode + re-encode
+    if pyvips is not None:
+        try:
+            return _vips_preview(src, max_side)
+        except pyvips.Error:
+            pass  # fall back to Pillow below
     with Image.open(io.BytesIO(src)) as im:
-        im = im.convert("RGB")
-        im.thumbnail((max_side, max_side))
+        im.draft("RGB", (max_side, max_side))  # JPEG: libjpeg downscales during IDCT
+        if im.mode in ("RGBA", "LA", "PA", "P"):  # flatten onto white, as the vips path does
+            rgba = im.convert("RGBA")
+            im = Image.new("RGB", rgba.size, (255, 255, 255))
+            im.paste(rgba, mask=rgba.getchannel("A"))
+        else:
+            im = im.convert("RGB")
+        im.thumbnail((max_side, max_side))  # Pillow's default filter (BICUBIC); draft() did the coarse cut
         out = io.BytesIO()
-        im.save(out, format="JPEG", quality=88, optimize=True)
+        im.save(out, format="JPEG", quality=88)  # single-pass Huffman: optimize=True ~doubles encode time
         return out.getvalue()
 
+# ---- On-disk tier (diskcache, optional): images are immutable per file id, logs per version ----
+_DISK_CACHE_DIR = "/tmp/drive_blob_cache"
+_DISK_BLOB_TTL = 86400
+
+@st.cache_resource
+def _disk_blobs():
+    if diskcache is None:
+        return None
+    try:
+        return diskcache.Cache(_DISK_CACHE_DIR, size_limit=2 * 1024 ** 3)
+    except Exception:
+        return None  # unwritable /tmp etc.: run memory-only
+
+# ---- Process-level preview LRU, filled by background prefetch ----
+@st.cache_resource
+def _preview_lru() -> Tuple[threading.Lock, "OrderedDict[Tuple[str, int], bytes]", Any]:
+    return threading.Lock(), OrderedDict(), _disk_blobs()
+
+def _lru_get(lru, key) -> Optional[bytes]:
+    lock, d, disk = lru
+    with lock:
+        val = d.get(key)
+        if val is not None:
+            d.move_to_end(key)
+            return val
+    if disk is not None:
+        val = disk.get(key)
+        if val is not None:
+            _lru_put(lru, key, val, persist=False)
+    return val
+
+def _lru_put(lru, key, value: bytes, persist: bool = True):
+    lock, d, disk = lru
+    with lock:
+        d[key] = value
+        d.move_to_end(key)
+        while len(d) > _PREVIEW_LRU_CAP:
+            d.popitem(last=False)
+    if persist and disk is not None:
+        disk.set(key, value, expire=_DISK_BLOB_TTL)
+
+def _prefetch_preview_task(file_id: str, max_side: int, links: Dict,
+                           session: requests.Session, lru, http=None):
+    key = (file_id, max_side)
+    if _lru_get(lru, key) is not None:
+        return
+    tb = _fetch_thumbnail(file_id, links, session, max_side, http=http)
+    src = tb if tb is not None else _download_bytes_with_retry(drive, file_id, http=http)
+    _lru_put(lru, key, _encode_preview(src, max_side, from_thumb=tb is not None))
+
+def prefetch_previews(file_ids: List[Optional[str]], max_side: int = 680) -> List[Future]:
+    """Warm previews on the I/O pool so the next render is a cache hit; callers may ignore the futures."""
+    links, session, lru = _thumb_link_cache(), get_http_session(), _preview_lru()
+    return [submit_io(_prefetch_preview_task, fid, max_side, links, session, lru)
+            for fid in dict.fromkeys(file_ids)
+            if fid and _lru_get(lru, (fid, max_side)) is None]
+
+def fetch_two_previews_parallel(h_id: Optional[str], a_id: Optional[str],
+                                max_side: int = 680, timeout: float = 12):
+    """Load both sides of the pair concurrently; preview_bytes then reads them from the LRU."""
+    futs = prefetch_previews([h_id, a_id], max_side)
+    if futs:
+        wait_futures(futs, timeout=timeout)
+
+@st.cache_data(show_spinner=False, max_entries=256, ttl=3600)
+def preview_bytes(file_id: str, max_side: int = 680) -> bytes:
+    warm = _lru_get(_preview_lru(), (file_id, max_side))
+    if warm is not None:
+        return warm
+    tb = drive_thumbnail_bytes(file_id, max_side)
+    src = tb if tb is not None else _download_bytes_with_retry(get_drive(), file_id)
+    out = _encode_preview(src, max_side, from_thumb=tb is not None)
+    _lru_put(_preview_lru(), (file_id, max_side), out)
+    return out
+
 @st.cache_data(show_spinner=False, max_entries=128, ttl=1800)
 def original_bytes(file_id: str) -> bytes:
-    return _download_bytes_with_retry(get_drive(), file_id)
+    disk = _disk_blobs()
+    if disk is not None:
+        hit = disk.get(("orig", file_id))
+        if hit is not None:
+            return hit
+    data = _download_bytes_with_retry(get_drive(), file_id)
+    if disk is not None:
+        disk.set(("orig", file_id), data, expire=_DISK_BLOB_TTL)
+    return data
 
 def show_image(file_id: Optional[str], caption: str, high_quality: bool):
     if not file_id:
@@ -212,9 +1175,25 @@ def show_image(file_id: Optional[str], caption: str, high_quality: bool):
     except Exception as e:
         st.error(f"Failed to render {caption}: {e}")
 
+def decision_panel(title: str, side: str, file_id: Optional[str], name: str,
+                   saved: Optional[str], pk: str, keys: Dict[str, str]):
+    """Image plus Accept/Reject for one side; `side` is the st.session_state.dec key."""
+    st.markdown(f"**{title}**")
+    show_image(file_id, name, high_quality=st.session_state.hq)
+    tag = "h" if side == "hypo" else "a"
+    for col, status, label in zip(st.columns(2), ("accepted", "rejected"), ("✅ Accept", "❌ Reject")):
+        with col:
+            key = keys[f"{status[:3]}_{tag}"]
+            if st.button(f"{label} ({side})", key=key, disabled=cooldown_disabled(key)):
+                cooldown_start(key)
+                st.session_state.dec[pk][side] = status
+    cur = st.session_state.dec[pk][side]
+    st.markdown(f'<div class="caption">Current: <b>{cur if cur else "—"}</b> | '
+                f'Saved: <b>{saved or "—"}</b></div>', unsafe_allow_html=True)
+
 # =========================== Category config ===========================
 def _safe_secret(key: str, default=None):
-    return st.secrets.get("gcp", {}).get(key, default)
+    return _GCP.get(key, default)
 
 CAT = {
     "demography": {
@@ -225,6 +1204,8 @@ CAT = {
         "dst_adv":  _safe_secret("demography_adv_filtered"),
         "log_hypo": _safe_secret("demography_hypo_filtered_log_id"),
         "log_adv":  _safe_secret("demography_adv_filtered_log_id"),
+        "idx_hypo": _safe_secret("demography_hypo_index_id"),
+        "idx_adv":  _safe_secret("demography_adv_index_id"),
         "hypo_prefix": "dem_h", "adv_prefix":  "dem_ah",
     },
     "animal": {
@@ -235,6 +1216,8 @@ CAT = {
         "dst_adv":  _safe_secret("animal_adv_filtered"),
         "log_hypo": _safe_secret("animal_hypo_filtered_log_id"),
         "log_adv":  _safe_secret("animal_adv_filtered_log_id"),
+        "idx_hypo": _safe_secret("animal_hypo_index_id"),
+        "idx_adv":  _safe_secret("animal_adv_index_id"),
         "hypo_prefix": "ani_h", "adv_prefix":  "ani_ah",
     },
     "objects": {
@@ -245,6 +1228,8 @@ CAT = {
         "dst_adv":  _safe_secret("objects_adv_filtered"),
         "log_hypo": _safe_secret("objects_hypo_filtered_log_id"),
         "log_adv":  _safe_secret("objects_adv_filtered_log_id"),  # <-- FIXED
+        "idx_hypo": _safe_secret("objects_hypo_index_id"),
+        "idx_adv":  _safe_secret("objects_adv_index_id"),
         "hypo_prefix": "obj_h", "adv_prefix":  "obj_ah",
     },
 }
@@ -255,89 +1240,169 @@ for _cat, _cfg in CAT.items():
         st.warning(f"[Config] {_cat}: log_hypo and log_adv point to the same file. Please fix your secrets.")
 
 # ===================== Readers / progress ======================
+@functools.lru_cache(maxsize=128)
 def canonical_user(name: str) -> str:
     return (name or "").strip().lower()
 
-@st.cache_data(show_spinner=False)
-def load_meta(jsonl_id: str) -> List[Dict[str, Any]]:
+@st.cache_data(show_spinner=False, ttl=60)
+def meta_version(jsonl_id: str) -> str:
+    """modifiedTime of the metadata JSONL; load_meta is keyed on it, so edits on Drive show up."""
     try:
-        drive.files().get(fileId=jsonl_id, fields="id",
-                          supportsAllDrives=True).execute()
-    except HttpError as e:
+        return drive.files().get(fileId=jsonl_id, fields="modifiedTime",
+                                 supportsAllDrives=True).execute().get("modifiedTime", "")
+    except Exception:
+        return ""  # let load_meta's download report the problem
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def load_meta(jsonl_id: str, version: str = "") -> List[Dict[str, Any]]:
+    """Metadata rows, shared across sessions without per-hit copies: treat as read-only."""
+    try:  # no separate access probe: a missing or forbidden file fails the download fast
+        raw = read_bytes_from_drive(drive, jsonl_id)
+    except (HttpError, requests.RequestException) as e:
         st.error(f"Cannot access JSONL file: {e}"); st.stop()
-    raw = read_text_from_drive(drive, jsonl_id)
-    out: List[Dict[str, Any]] = []
-    for ln in raw.splitlines():
-        ln = ln.strip()
-        if not ln: continue
-        try: out.append(json.loads(ln))
-        except Exception: pass
-    return out
+    return latest_rows(raw)
 
-def latest_rows(jsonl_text: str) -> List[Dict[str, Any]]:
+def latest_rows(raw: bytes) -> List[Dict[str, Any]]:
+    """Parse JSONL straight from bytes (no full-text decode); bad lines are skipped."""
+    lines = raw.split(b"\n")
+    try:  # fast path: one comprehension, no per-line exception handling
+        return [_json_loads(ln) for ln in lines if ln]
+    except Exception:
+        pass  # a corrupt line somewhere: redo tolerantly below
     out: List[Dict[str, Any]] = []
-    for ln in jsonl_text.splitlines():
-        ln = ln.strip()
-        if not ln: continue
-        try: out.append(json.loads(ln))
+    for ln in lines:
+        if not ln: continue  # whitespace-only lines fail the parse below
+        try: out.append(_json_loads(ln))
         except Exception: pass
     return out
 
-@st.cache_data(show_spinner=False)
-def load_latest_map_for_annotator(log_file_id: str, who: str) -> Dict[str, Dict]:
-    rows = latest_rows(read_text_from_drive(drive, log_file_id))
+@st.cache_data(show_spinner=False, ttl=60)
+def log_versions(log_ids: Tuple[str, ...]) -> Dict[str, str]:
+    """
+    Change token per log: master modifiedTime plus its deltas' id@modifiedTime in creation order.
+    All probes for all logs go out in one batched request. Readers take the token
+    as part of their cache key, so an unchanged log is never downloaded again.
+    """
+    masters: Dict[str, str] = {}
+    deltas: Dict[str, List[str]] = {lid: [] for lid in log_ids}
+    failed: set = set()
+    more: Dict[str, str] = {}  # logs whose delta listing has further pages
+    def _cb(request_id, response, exception):
+        kind, _, lid = request_id.partition(":")
+        if exception is not None:
+            failed.add(lid); return
+        if kind == "m":
+            masters[lid] = response.get("modifiedTime", "")
+        else:
+            deltas[lid] += [f"{f['id']}@{f.get('modifiedTime', '')}" for f in _listed_deltas(lid, response)]
+            if response.get("nextPageToken"):
+                more[lid] = response["nextPageToken"]
+    parents = log_parents(list(log_ids))  # one batched lookup on a cold start, free after
+    batch = drive.new_batch_http_request(callback=_cb)
+    for lid in log_ids:
+        batch.add(drive.files().get(fileId=lid, fields="modifiedTime", supportsAllDrives=True),
+                  request_id=f"m:{lid}")
+        if lid not in parents:  # parent unknown, not absent: the delta set cannot be trusted
+            failed.add(lid); continue
+        parent = parents[lid]
+        if parent:
+            batch.add(_delta_list_request(lid, parent), request_id=f"d:{lid}")
+    try:
+        batch.execute()
+    except Exception:
+        failed.update(log_ids)
+    for lid, token in more.items():  # rare: only logs with over 1000 pending deltas
+        try:
+            while token and lid not in failed:
+                resp = _delta_list_request(lid, parents[lid], token).execute()
+                deltas[lid] += [f"{f['id']}@{f.get('modifiedTime', '')}" for f in _listed_deltas(lid, resp)]
+                token = resp.get("nextPageToken")
+        except Exception:
+            failed.add(lid)
+    # unknown state -> unique token, so readers fetch fresh rather than trust a stale entry
+    return {lid: (f"?{time.time()}" if lid in failed or lid not in masters
+                  else masters[lid] + "|" + ",".join(deltas[lid]))
+            for lid in log_ids}
+
+@st.cache_resource(show_spinner=False, max_entries=64)
+def load_latest_map_for_annotator(log_file_id: str, who: str, version: str = "") -> Dict[str, Dict]:
+    """pair_key -> {status, copied_id} of this annotator's newest row per pair."""
+    lines = log_bytes_at(log_file_id, version).split(b"\n")
     target = canonical_user(who)
     m: Dict[str, Dict] = {}
-    for r in rows:
+    # parse while scanning (no intermediate row list), newest first so each pair is written once
+    for ln in reversed(lines):
+        if not ln: continue
+        try: r = _json_loads(ln)
+        except Exception: continue
         pk = r.get("pair_key") or f"{r.get('hypo_id','')}|{r.get('adversarial_id','')}"
-        r["pair_key"] = pk
+        if pk in m:
+            continue
         ann = canonical_user(r.get("annotator") or r.get("_annotator_canon") or "")
-        if not ann:
-            ann = target; r["annotator"] = who
-        if ann == target:
-            m[pk] = r
+        if ann and ann != target:
+            continue
+        # keep only what the page reads: the cached entry drops the copied text fields
+        m[pk] = {"status": r.get("status"), "copied_id": r.get("copied_id")}
     return m
 
+# ---- This session's saves, layered over the cached log state they were written on top of ----
+def own_rows(log_id: str, version: str) -> List[Dict[str, Any]]:
+    """Rows saved here since `version` was probed; empty once a newer version includes them."""
+    ov = st.session_state.get("_own_rows", {}).get(log_id)
+    return ov["rows"] if ov and ov["ver"] == version else []
+
+def note_own_rows(log_id: str, version: str, rows: List[Dict[str, Any]]):
+    overlay = st.session_state.setdefault("_own_rows", {})
+    ov = overlay.get(log_id)
+    if not ov or ov["ver"] != version:
+        ov = overlay[log_id] = {"ver": version, "rows": []}
+    ov["rows"].extend(rows)
+
 def build_completion_sets(cat_cfg: dict, who: str) -> Tuple[set, Dict[str, Dict], Dict[str, Dict]]:
-    log_h_map = load_latest_map_for_annotator(cat_cfg["log_hypo"], who)
-    log_a_map = load_latest_map_for_annotator(cat_cfg["log_adv"],  who)
-    completed = set()
-    keys = set(log_h_map.keys()) | set(log_a_map.keys())
-    for pk in keys:
-        s_h = (log_h_map.get(pk, {}).get("status") or "").strip()
-        s_a = (log_a_map.get(pk, {}).get("status") or "").strip()
-        if s_h and s_a:
-            completed.add(pk)
+    lh, la = cat_cfg["log_hypo"], cat_cfg["log_adv"]
+    ver = log_versions((lh, la))
+    held = warm_log_bytes(ver)  # both logs download at once; the loaders below read them from memory
+    log_h_map = load_latest_map_for_annotator(lh, who, held[lh])
+    log_a_map = load_latest_map_for_annotator(la, who, held[la])
+    # the loaders return shared cached dicts: overlay this session's saves on copies
+    own_h, own_a = own_rows(lh, ver[lh]), own_rows(la, ver[la])
+    if own_h: log_h_map = {**log_h_map, **{r["pair_key"]: r for r in own_h}}
+    if own_a: log_a_map = {**log_a_map, **{r["pair_key"]: r for r in own_a}}
+    # a pair is complete only when both sides have a status, so one side's keys suffice
+    completed = {pk for pk, r in log_h_map.items()
+                 if (r.get("status") or "").strip()
+                 and (log_a_map.get(pk, {}).get("status") or "").strip()}
     return completed, log_h_map, log_a_map
 
 def pk_of(e: Dict[str, Any]) -> str:
     return f"{e.get('hypo_id','')}|{e.get('adversarial_id','')}"
 
-@st.cache_data(show_spinner=False)
-def count_records_for_annotator(log_file_id: str, who: str) -> int:
-    text = read_text_from_drive(drive, log_file_id)
-    who_c = canonical_user(who)
-    cnt = 0
-    for ln in text.splitlines():
-        ln = ln.strip()
-        if not ln:
-            continue
-        try:
-            r = json.loads(ln)
-        except Exception:
-            continue
-        ann = canonical_user(r.get("annotator") or r.get("_annotator_canon") or "")
-        if not ann:
-            ann = who_c
-        if ann == who_c:
-            cnt += 1
-    return cnt
-
-def first_undecided_index_from_counts(meta_len: int, hypo_log_id: str, adv_log_id: str, who: str) -> int:
-    h = count_records_for_annotator(hypo_log_id, who)
-    a = count_records_for_annotator(adv_log_id, who)
-    done = min(h, a)
-    return min(done, max(0, meta_len - 1))
+@st.cache_resource(show_spinner=False, max_entries=8)
+def meta_pk_list(jsonl_id: str, version: str = "") -> List[str]:
+    """Pair keys in row order, built once per metadata version (the shared rows stay untouched)."""
+    return [pk_of(e) for e in load_meta(jsonl_id, version)]
+
+def first_undecided_index(pks: List[str], completed: set, start: int = 0) -> int:
+    for n in range(start, len(pks)):
+        if pks[n] not in completed:
+            return n
+    return max(0, len(pks) - 1)
+
+def resume_index(cat: str, jsonl_id: str, who: str, pks: List[str], completed: set) -> int:
+    """
+    First pair not yet decided on both sides. A cursor per (category, metadata file, annotator)
+    lets each scan start where the last one stopped instead of at row 0. It is trusted only
+    while the row before it still counts as decided: a partial log read or edited metadata
+    can undo that, and then the scan starts over.
+    """
+    cursors = st.session_state.setdefault("_undecided_cursor", {})
+    key = (cat, jsonl_id, canonical_user(who))
+    start = cursors.get(key, 0)
+    if start and (start > len(pks) or pks[start - 1] not in completed):
+        start = 0
+    idx = first_undecided_index(pks, completed, start)
+    cursors[key] = idx
+    return idx
 
 # ---------- Jump helpers ----------
 def rows_per_prompt() -> int:
@@ -346,6 +1411,8 @@ def rows_per_prompt() -> int:
     except Exception:
         return 5
 
+_PROMPT_NUM_RE = re.compile(r"(\d+)$")
+
 def prompt_to_base_index(prompt_id: str, total_len: int) -> int:
     """
     Map prompt id (e.g., 'dem_00033' or '33') to the FIRST row of that prompt.
@@ -353,7 +1420,7 @@ def prompt_to_base_index(prompt_id: str, total_len: int) -> int:
     """
     if not prompt_id:
         return 0
-    m = re.search(r"(\d+)$", str(prompt_id).strip())
+    m = _PROMPT_NUM_RE.search(str(prompt_id).strip())
     if not m:
         return 0
     n = int(m.group(1))
@@ -375,6 +1442,18 @@ if "last_save_token" not in st.session_state: st.session_state.last_save_token =
 if "idx_initialized_for" not in st.session_state: st.session_state.idx_initialized_for = None
 if "jump_mode" not in st.session_state: st.session_state.jump_mode = False  # <— NEW
 
+drain_retry_queue()
+
+# first run after sign-in: list source folders while the user looks at the page
+if not st.session_state.get("_indexes_warmed"):
+    st.session_state._indexes_warmed = True
+    _to_warm: List[Optional[str]] = []
+    for _cat in st.session_state.allowed:
+        _cfg = CAT.get(_cat, {})
+        if not _cfg.get("idx_hypo"): _to_warm.append(_cfg.get("src_hypo"))  # sidecar folders need no listing
+        if not _cfg.get("idx_adv"):  _to_warm.append(_cfg.get("src_adv"))
+    warm_folder_indexes(_to_warm)
+
 # ========================= MAIN (single page) =========================
 st.caption(f"Signed in as **{st.session_state.user}**")
 left, right = st.columns([2, 1.2], gap="large")
@@ -384,6 +1463,8 @@ with right:
     cat_pick = st.selectbox("Category", allowed,
                             index=allowed.index(st.session_state.cat) if st.session_state.cat in allowed else 0)
     if cat_pick != st.session_state.cat:
+        _prev_cfg = CAT.get(st.session_state.cat, {})
+        flush_session_deltas([_prev_cfg.get("log_hypo"), _prev_cfg.get("log_adv")])
         st.session_state.cat = cat_pick
         st.session_state.dec = {}
         st.session_state.idx_initialized_for = None
@@ -391,11 +1472,13 @@ with right:
 
     who = st.session_state.user
     cfg  = CAT[st.session_state.cat]
-    meta = load_meta(cfg["jsonl_id"])
+    meta_ver = meta_version(cfg["jsonl_id"])
+    meta = load_meta(cfg["jsonl_id"], meta_ver)
+    pks = meta_pk_list(cfg["jsonl_id"], meta_ver)
 
-    done_h = count_records_for_annotator(cfg["log_hypo"], who)
-    done_a = count_records_for_annotator(cfg["log_adv"],  who)
-    completed = min(done_h, done_a)
+    # one completion pass per render, shared with the auto-jump and the work area below
+    completed_set, log_h_map, log_a_map = build_completion_sets(cfg, who)
+    completed = len(completed_set.intersection(pks))  # one C-level pass
     total_pairs = len(meta)
     pending = max(0, total_pairs - completed)
 
@@ -422,47 +1505,27 @@ with right:
             base_idx = prompt_to_base_index(jump_value, len(meta))
             st.session_state.idx = base_idx
             st.session_state.jump_mode = True  # <— turn on jump mode
-            try:
-                def progress_file_id_for(cat: str, who: str) -> str:
-                    parent = st.secrets["gcp"].get("progress_parent_id") or st.secrets["gcp"][f"{cat}_hypo_filtered_log_id"]
-                    fname = f"progress_{cat}_{canonical_user(who)}.txt"
-                    q = f"'{parent}' in parents and name = '{fname}' and trashed = false"
-                    resp = drive.files().list(q=q, fields="files(id,name)", pageSize=1,
-                                              supportsAllDrives=True, includeItemsFromAllDrives=True).execute()
-                    files = resp.get("files", [])
-                    if files: return files[0]["id"]
-                    media = MediaIoBaseUpload(io.BytesIO(b"0"), mimetype="text/plain", resumable=False)
-                    meta_tmp = {"name": fname, "parents":[parent], "mimeType":"text/plain"}
-                    return drive.files().create(body=meta_tmp, media_body=media, fields="id",
-                                                supportsAllDrives=True).execute()["id"]
-                pfid = progress_file_id_for(st.session_state.cat, st.session_state.user)
-                write_text_to_drive(drive, pfid, str(base_idx))
-            except Exception:
-                pass
+            persist_progress(base_idx)
             st.rerun()
 
-# ---------- Auto-jump on first load using counts ----------
+# ---------- Auto-jump on first load to the first undecided pair ----------
 if st.session_state.idx_initialized_for != st.session_state.cat:
-    cfg_init  = CAT[st.session_state.cat]
-    meta_init = load_meta(cfg_init["jsonl_id"])
-    idx = first_undecided_index_from_counts(len(meta_init), cfg_init["log_hypo"], cfg_init["log_adv"], st.session_state.user)
+    idx = resume_index(st.session_state.cat, cfg["jsonl_id"], who, pks, completed_set)
     st.session_state.idx = idx
     st.session_state.idx_initialized_for = st.session_state.cat
 
 # ------------------------------ LEFT work area ------------------------------
 with left:
-    cfg = CAT[st.session_state.cat]
-    meta = load_meta(cfg["jsonl_id"])
+    # cfg / meta / completion sets come from the right column: computed once per render
     if not meta:
         st.warning("No records."); st.stop()
 
-    completed_set, log_h_map, log_a_map = build_completion_sets(cfg, st.session_state.user)
-
     i = max(0, min(st.session_state.idx, len(meta)-1))
     entry = meta[i]
     hypo_name = entry.get("hypo_id", "")
     adv_name  = entry.get("adversarial_id", "")
-    pk        = f"{hypo_name}|{adv_name}"
+    pk        = pks[i]
+    keys      = btn_keys(pk)
 
     saved_h_row = (log_h_map.get(pk, {}) or {})
     saved_a_row = (log_a_map.get(pk, {}) or {})
@@ -485,46 +1548,27 @@ with left:
         with st.expander("ADVERSARIAL (prototype) — show/hide", expanded=False):
             st.markdown(f'<div class="small-text">{entry.get("adversarial","")}</div>', unsafe_allow_html=True)
 
-    src_h_id = find_file_id_in_folder(drive, cfg["src_hypo"], hypo_name)
-    src_a_id = find_file_id_in_folder(drive, cfg["src_adv"],  adv_name)
+    # ids for a window around the current pair are resolved in one batch and kept per session
+    src_ids = ensure_id_window(cfg, meta, i)
+    src_h_id = src_ids.get((cfg["src_hypo"], hypo_name))
+    src_a_id = src_ids.get((cfg["src_adv"],  adv_name))
+    ahead = [src_ids.get((f, n)) for f, n, _ in _pair_lookups(cfg, meta[i + 1:i + 1 + _PREFETCH_AHEAD])]
+
+    if not st.session_state.hq:
+        # links for every pair in one batch; the pairs ahead download while this one renders
+        prefetch_thumbnail_links([src_h_id, src_a_id, *ahead])
+        fetch_two_previews_parallel(src_h_id, src_a_id)
+        try:
+            prefetch_previews(ahead)
+        except Exception:
+            pass  # prefetch is best-effort; navigation must not depend on it
 
     imgL, imgR = st.columns(2, gap="large")
 
     with imgL:
-        st.markdown("**Hypothesis (non-proto)**")
-        show_image(src_h_id, hypo_name, high_quality=st.session_state.hq)
-        b1, b2 = st.columns(2)
-        with b1:
-            acc_key = f"acc_h_{pk}"
-            if st.button("✅ Accept (hypo)", key=acc_key, disabled=cooldown_disabled(acc_key)):
-                cooldown_start(acc_key)
-                st.session_state.dec[pk]["hypo"] = "accepted"
-        with b2:
-            rej_key = f"rej_h_{pk}"
-            if st.button("❌ Reject (hypo)", key=rej_key, disabled=cooldown_disabled(rej_key)):
-                cooldown_start(rej_key)
-                st.session_state.dec[pk]["hypo"] = "rejected"
-        cur_h = st.session_state.dec[pk]["hypo"]
-        st.markdown(f'<div class="caption">Current: <b>{cur_h if cur_h else "—"}</b> | '
-                    f'Saved: <b>{saved_h or "—"}</b></div>', unsafe_allow_html=True)
-
+        decision_panel("Hypothesis (non-proto)", "hypo", src_h_id, hypo_name, saved_h, pk, keys)
     with imgR:
-        st.markdown("**Adversarial (proto)**")
-        show_image(src_a_id, adv_name, high_quality=st.session_state.hq)
-        b3, b4 = st.columns(2)
-        with b3:
-            acca_key = f"acc_a_{pk}"
-            if st.button("✅ Accept (adv)", key=acca_key, disabled=cooldown_disabled(acca_key)):
-                cooldown_start(acca_key)
-                st.session_state.dec[pk]["adv"] = "accepted"
-        with b4:
-            reja_key = f"rej_a_{pk}"
-            if st.button("❌ Reject (adv)", key=reja_key, disabled=cooldown_disabled(reja_key)):
-                cooldown_start(reja_key)
-                st.session_state.dec[pk]["adv"] = "rejected"
-        cur_a = st.session_state.dec[pk]["adv"]
-        st.markdown(f'<div class="caption">Current: <b>{cur_a if cur_a else "—"}</b> | '
-                    f'Saved: <b>{saved_a or "—"}</b></div>', unsafe_allow_html=True)
+        decision_panel("Adversarial (proto)", "adv", src_a_id, adv_name, saved_a, pk, keys)
 
     st.markdown("<hr/>", unsafe_allow_html=True)
 
@@ -540,7 +1584,7 @@ with left:
             return
 
         ts  = int(time.time())
-        base = dict(entry)
+        base = dict(entry)  # entry is a shared cached row: never write into it
         base["pair_key"]  = pk
         base["annotator"] = st.session_state.user
         base["_annotator_canon"] = canonical_user(st.session_state.user)
@@ -552,149 +1596,109 @@ with left:
         new_h_copied  = prev_h_copied
         new_a_copied  = prev_a_copied
 
+        # flip-safe: drop any existing shortcut, then (re)create it if accepted — one batched RTT
+        delete_ids: List[Optional[str]] = []
+        creates: Dict[str, Tuple[str, str, str]] = {}
         try:
-            if saved_h == "accepted" and new_h_status != "accepted":
-                delete_file_by_id(drive, prev_h_copied or find_file_id_in_folder(drive, cfg["dst_hypo"], hypo_name))
+            touch_h = saved_h == "accepted" or new_h_status == "accepted"
+            touch_a = saved_a == "accepted" or new_a_status == "accepted"
+            # shortcuts not recorded in the log are looked up together, in one batched RTT
+            lookups = [(cfg["dst_hypo"], hypo_name)] if touch_h and not prev_h_copied else []
+            if touch_a and not prev_a_copied:
+                lookups.append((cfg["dst_adv"], adv_name))
+            found = find_file_ids_in_folders(drive, lookups) if lookups else {}
+
+            if touch_h:
+                delete_ids.append(prev_h_copied or found.get((cfg["dst_hypo"], hypo_name)))
                 new_h_copied = None
-            if new_h_status == "accepted":
-                delete_file_by_id(drive, prev_h_copied or find_file_id_in_folder(drive, cfg["dst_hypo"], hypo_name))
-                if src_h_id:
-                    new_h_copied = create_shortcut_to_file(drive, src_h_id, hypo_name, cfg["dst_hypo"])
+                if new_h_status == "accepted" and src_h_id:
+                    creates["hypo"] = (src_h_id, hypo_name, cfg["dst_hypo"])
 
-            if saved_a == "accepted" and new_a_status != "accepted":
-                delete_file_by_id(drive, prev_a_copied or find_file_id_in_folder(drive, cfg["dst_adv"], adv_name))
+            if touch_a:
+                delete_ids.append(prev_a_copied or found.get((cfg["dst_adv"], adv_name)))
                 new_a_copied = None
-            if new_a_status == "accepted":
-                delete_file_by_id(drive, prev_a_copied or find_file_id_in_folder(drive, cfg["dst_adv"], adv_name))
-                if src_a_id:
-                    new_a_copied = create_shortcut_to_file(drive, src_a_id, adv_name, cfg["dst_adv"])
+                if new_a_status == "accepted" and src_a_id:
+                    creates["adv"] = (src_a_id, adv_name, cfg["dst_adv"])
+
+            created = batch_shortcut_updates(drive, delete_ids, creates)
+            new_h_copied = created.get("hypo", new_h_copied)
+            new_a_copied = created.get("adv", new_a_copied)
         except HttpError as e:
             st.session_state.saving = False
             st.session_state.last_save_flash = {"msg": f"Drive shortcut update failed: {e}", "ok": False, "ts": time.time()}
             return
 
-        rec_h = dict(base); rec_h.update({"side":"hypothesis", "status": new_h_status, "decided_at": ts})
+        # one dict per record, built in place (same key order as the old copy-then-update)
+        rec_h = {**base, "side": "hypothesis", "status": new_h_status, "decided_at": ts}
         if new_h_copied: rec_h["copied_id"] = new_h_copied
-        rec_a = dict(base); rec_a.update({"side":"adversarial", "status": new_a_status, "decided_at": ts})
+        rec_a = {**base, "side": "adversarial", "status": new_a_status, "decided_at": ts}
         if new_a_copied: rec_a["copied_id"] = new_a_copied
 
-        token = hashlib.sha1(json.dumps(
-            {"pk":pk, "h":rec_h["status"], "a":rec_a["status"], "who":base["_annotator_canon"]}
-        ).encode()).hexdigest()
+        # idempotency token: compared for equality only, so a plain tuple is enough
+        token = (pk, new_h_status, new_a_status, base["_annotator_canon"])
         if st.session_state.last_save_token == token:
             st.session_state.saving = False
             st.session_state.last_save_flash = {"msg": "Already saved this exact decision.", "ok": True, "ts": time.time()}
             return
 
         try:
-            append_lines_to_drive_text(drive, cfg["log_hypo"], [json.dumps(rec_h, ensure_ascii=False) + "\n"])
-            append_lines_to_drive_text(drive, cfg["log_adv"],  [json.dumps(rec_a, ensure_ascii=False) + "\n"])
+            append_logs([(cfg["log_hypo"], [_jsonl_line(rec_h)]),
+                         (cfg["log_adv"],  [_jsonl_line(rec_a)])])
         except Exception as e:
             st.session_state.saving = False
             st.session_state.last_save_flash = {"msg": f"Failed to append logs: {e}", "ok": False, "ts": time.time()}
             return
 
-        try: load_meta.clear()
-        except: pass
-        try: load_latest_map_for_annotator.clear()
-        except: pass
-        try: count_records_for_annotator.clear()
-        except: pass
+        # no cache clears: the saved rows ride on top of the cached log state until the next
+        # version probe (ttl 60s) sees them in Drive; maps only hold this annotator's own rows
+        ver = log_versions((cfg["log_hypo"], cfg["log_adv"]))
+        note_own_rows(cfg["log_hypo"], ver[cfg["log_hypo"]], [rec_h])
+        note_own_rows(cfg["log_adv"],  ver[cfg["log_adv"]],  [rec_a])
 
         st.session_state.last_save_token = token
         st.session_state.saving = False
 
         # ---------- Where to go next ----------
-        meta_local = load_meta(cfg["jsonl_id"])
         if st.session_state.get("jump_mode", False):
             # stay in the jumped flow: just advance by one row
-            next_idx = min(st.session_state.idx + 1, max(0, len(meta_local) - 1))
+            next_idx = min(st.session_state.idx + 1, max(0, len(meta) - 1))
         else:
-            # default resume-from-progress behavior
-            done_h2 = count_records_for_annotator(cfg["log_hypo"], st.session_state.user)
-            done_a2 = count_records_for_annotator(cfg["log_adv"],  st.session_state.user)
-            next_idx = min(done_h2, done_a2)
+            # default resume-from-progress behavior: this render's set plus the pair just
+            # saved (both sides decided) is exact, so no second completion pass is needed
+            next_idx = resume_index(st.session_state.cat, cfg["jsonl_id"], who, pks, completed_set | {pk})
 
         st.session_state.idx = next_idx
 
         # persist updated pointer (optional)
-        try:
-            def progress_file_id_for(cat: str, who: str) -> str:
-                parent = st.secrets["gcp"].get("progress_parent_id") or st.secrets["gcp"][f"{cat}_hypo_filtered_log_id"]
-                fname = f"progress_{cat}_{canonical_user(who)}.txt"
-                q = f"'{parent}' in parents and name = '{fname}' and trashed = false"
-                resp = drive.files().list(q=q, fields="files(id,name)", pageSize=1,
-                                          supportsAllDrives=True, includeItemsFromAllDrives=True).execute()
-                files = resp.get("files", [])
-                if files: return files[0]["id"]
-                media = MediaIoBaseUpload(io.BytesIO(b"0"), mimetype="text/plain", resumable=False)
-                meta_tmp = {"name": fname, "parents":[parent], "mimeType":"text/plain"}
-                return drive.files().create(body=meta_tmp, media_body=media, fields="id",
-                                            supportsAllDrives=True).execute()["id"]
-            pfid = progress_file_id_for(st.session_state.cat, st.session_state.user)
-            write_text_to_drive(drive, pfid, str(st.session_state.idx))
-        except Exception:
-            pass
+        persist_progress(st.session_state.idx)
 
         st.session_state.last_save_flash = {"msg": "Saved.", "ok": True, "ts": time.time()}
 
     navL, navC, navR = st.columns([1, 4, 1])
     with navL:
-        prev_key = f"prev_{pk}"
+        prev_key = keys["prev"]
         if st.button("⏮ Prev", key=prev_key, disabled=cooldown_disabled(prev_key)):
             cooldown_start(prev_key)
             st.session_state.idx = max(0, i-1)
-            try:
-                def progress_file_id_for(cat: str, who: str) -> str:
-                    parent = st.secrets["gcp"].get("progress_parent_id") or st.secrets["gcp"][f"{cat}_hypo_filtered_log_id"]
-                    fname = f"progress_{cat}_{canonical_user(who)}.txt"
-                    q = f"'{parent}' in parents and name = '{fname}' and trashed = false"
-                    resp = drive.files().list(q=q, fields="files(id,name)", pageSize=1,
-                                              supportsAllDrives=True, includeItemsFromAllDrives=True).execute()
-                    files = resp.get("files", [])
-                    if files: return files[0]["id"]
-                    media = MediaIoBaseUpload(io.BytesIO(b"0"), mimetype="text/plain", resumable=False)
-                    meta_tmp = {"name": fname, "parents":[parent], "mimeType":"text/plain"}
-                    return drive.files().create(body=meta_tmp, media_body=media, fields="id",
-                                                supportsAllDrives=True).execute()["id"]
-                pfid = progress_file_id_for(st.session_state.cat, st.session_state.user)
-                write_text_to_drive(drive, pfid, str(st.session_state.idx))
-            except Exception:
-                pass
+            persist_progress(st.session_state.idx)
             st.rerun()
 
     cur = st.session_state.dec.get(pk, {})
     can_save = (cur.get("hypo") in {"accepted", "rejected"}) and (cur.get("adv") in {"accepted", "rejected"})
 
     with navC:
-        save_key = f"save_{pk}"
+        save_key = keys["save"]
         disabled_save = (st.session_state.saving or not can_save or cooldown_disabled(save_key))
         if st.button("💾 Save", key="save_btn", type="primary", disabled=disabled_save, use_container_width=True):
             cooldown_start(save_key)
             save_now()
 
     with navR:
-        next_key = f"next_{pk}"
+        next_key = keys["next"]
         if st.button("Next ⏭", key=next_key, disabled=cooldown_disabled(next_key)):
             cooldown_start(next_key)
             st.session_state.idx = min(len(meta)-1, i+1)
-            try:
-                def progress_file_id_for(cat: str, who: str) -> str:
-                    parent = st.secrets["gcp"].get("progress_parent_id") or st.secrets["gcp"][f"{cat}_hypo_filtered_log_id"]
-                    fname = f"progress_{cat}_{canonical_user(who)}.txt"
-                    q = f"'{parent}' in parents and name = '{fname}' and trashed = false"
-                    resp = drive.files().list(q=q, fields="files(id,name)", pageSize=1,
-                                              supportsAllDrives=True, includeItemsFromAllDrives=True).execute()
-                    files = resp.get("files", [])
-                    if files: return files[0]["id"]
-                    media = MediaIoBaseUpload(io.BytesIO(b"0"), mimetype="text/plain", resumable=False)
-                    meta_tmp = {"name": fname, "parents":[parent], "mimeType":"text/plain"}
-                    return drive.files().create(body=meta_tmp, media_body=media, fields="id",
-                                                supportsAllDrives=True).execute()["id"]
-                pfid = progress_file_id_for(st.session_state.cat, st.session_state.user)
-                write_text_to_drive(drive, pfid, str(st.session_state.idx))
-            except Exception:
-                pass
+            persist_progress(st.session_state.idx)
             st.rerun()
 
     flash = st.session_state.get("last_save_flash")